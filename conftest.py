@@ -0,0 +1,12 @@
+from unittest import mock
+
+import pytest
+
+from django_goals.models import thread_local
+
+
+@pytest.fixture(autouse=True)
+def reset_old_goals_removed_at():
+    # worker turns record when they removed old goals, don't let it leak between tests
+    with mock.patch.object(thread_local, 'old_goals_removed_at', None):
+        yield
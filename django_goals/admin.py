@@ -1,22 +1,48 @@
-import json
+import functools
+from urllib.parse import quote
 
 from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.db import models
+from django.forms.models import BaseInlineFormSet
 from django.urls import reverse
 from django.urls.exceptions import NoReverseMatch
-from django.utils.html import format_html, format_html_join
+from django.utils.html import escape, format_html
+from django.utils.http import RFC3986_SUBDELIMS
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _
+from django.utils.translation import ngettext
 from django_object_actions import DjangoObjectActions, action
 
 from .models import (
     Goal, GoalDependency, GoalProgress, block_goal, unblock_retry_goal,
+    unblock_retry_goals,
 )
 
 
-class GoalDependencyInline(admin.TabularInline):
+PK_PLACEHOLDER = '__goals_related_object_pk__'
+
+
+class ReadOnlyMixin:
+    """
+    Goals are managed by workers and admin actions only, objects cannot be edited directly.
+    """
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class GoalDependencyInline(ReadOnlyMixin, admin.TabularInline):
     model = GoalDependency
     fk_name = 'dependent_goal'
     extra = 0
+    max_num = 0
+    can_delete = False
     fields = (
         'precondition_goal__id',
         'precondition_goal__state',
@@ -25,14 +51,8 @@ class GoalDependencyInline(admin.TabularInline):
     )
     readonly_fields = fields
 
-    def has_add_permission(self, request, obj):
-        return False
-
-    def has_change_permission(self, request, obj=None):
-        return False
-
-    def has_delete_permission(self, request, obj=None):
-        return False
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('precondition_goal')
 
     @admin.display(description='Precondition Goal ID')
     def precondition_goal__id(self, obj):
@@ -58,22 +78,47 @@ class GoalDependencyInline(admin.TabularInline):
         return obj.precondition_goal.created_at
 
 
-class GoalProgressInline(admin.TabularInline):
+class LatestProgressFormSet(BaseInlineFormSet):
+    """
+    Shows only the latest progress records. All of them can be seen in the progress changelist.
+    """
+    max_shown = 25
+
+    def get_queryset(self):
+        if not hasattr(self, '_latest_queryset'):
+            self._latest_queryset = super().get_queryset().order_by('-created_at')[:self.max_shown]
+        return self._latest_queryset
+
+
+class GoalProgressInline(ReadOnlyMixin, admin.TabularInline):
     model = GoalProgress
+    formset = LatestProgressFormSet
     extra = 0
+    max_num = 0
+    can_delete = False
+    verbose_name_plural = 'Latest progress'
 
-    def has_add_permission(self, request, obj):
-        return False
 
-    def has_change_permission(self, request, obj=None):
-        return False
+@admin.register(GoalProgress)
+class GoalProgressAdmin(ReadOnlyMixin, admin.ModelAdmin):
+    """
+    Progress records are browsed here, page by page, instead of being rendered all at once
+    on the goal change page.
+    """
+    list_display = ('id', 'goal', 'success', 'created_at', 'time_taken', 'message')
+    list_filter = ('success',)
+    ordering = ('-created_at',)
+    show_full_result_count = False
 
-    def has_delete_permission(self, request, obj=None):
-        return False
+
+class GoalChangeList(ChangeList):
+    def get_queryset(self, request, *args, **kwargs):
+        # instructions can be big and are not displayed on the list
+        return super().get_queryset(request, *args, **kwargs).defer('instructions')
 
 
 @admin.register(Goal)
-class GoalAdmin(DjangoObjectActions, admin.ModelAdmin):
+class GoalAdmin(ReadOnlyMixin, DjangoObjectActions, admin.ModelAdmin):
     list_display = (
         'id', 'state', 'handler',
         'precondition_date',
@@ -83,6 +128,9 @@ class GoalAdmin(DjangoObjectActions, admin.ModelAdmin):
     )
     list_filter = ('state', 'precondition_date')
     search_fields = ('id',)
+    # counting all goals on each filtered changelist page is expensive on big tables
+    show_full_result_count = False
+    list_per_page = 50
 
     fields = (
         'id',
@@ -96,6 +144,7 @@ class GoalAdmin(DjangoObjectActions, admin.ModelAdmin):
         'waiting_for_failed_count',
         'deadline',
         'created_at',
+        'progress_link',
         'related_objects',
     )
     inlines = (
@@ -106,85 +155,84 @@ class GoalAdmin(DjangoObjectActions, admin.ModelAdmin):
         'block',
         'unblock_retry',
     )
+    actions = (
+        'unblock_retry_selected',
+    )
 
-    def has_add_permission(self, request):
-        return False
-
-    def has_change_permission(self, request, obj=None):
-        return False
+    def get_changelist(self, request, **kwargs):
+        return GoalChangeList
 
-    def has_delete_permission(self, request, obj=None):
-        return False
+    def get_inline_instances(self, request, obj=None):
+        inline_instances = super().get_inline_instances(request, obj)
+        if obj is not None and obj.progress_count == 0:
+            # nothing to show, don't bother building the formset
+            inline_instances = [
+                inline for inline in inline_instances
+                if not isinstance(inline, GoalProgressInline)
+            ]
+        return inline_instances
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            progress_count=models.Count('progress'),
+    @admin.display(description='Progress')
+    def progress_link(self, obj):
+        return format_html(
+            '<a href="{}?goal_id={}">View all {} progress records</a>',
+            reverse('admin:django_goals_goalprogress_changelist'),
+            obj.id,
+            obj.progress_count,
         )
 
-    @admin.display
-    def progress_count(self, obj):
-        return obj.progress_count
-
     @admin.display(description='Instructions')
     def instructions_pre(self, obj):
         return format_html(
             '<pre style="white-space: pre-wrap;">{}</pre>',
-            json.dumps(obj.instructions, indent=2),
+            obj.instructions_pretty,
         )
 
     @admin.display(description='Related Objects')
     def related_objects(self, obj):
         rows_html = []
-        for field in obj._meta._relation_tree:
-            if field.model._meta.app_label == 'django_goals':
-                continue
-            related_objects = field.model.objects.filter(**{field.name: obj})
+        relation_fields = _relation_fields_in_use(_external_relation_fields(type(obj)), obj)
+        for field, field_verbose_name, model_verbose_name in relation_fields:
+            # these cells are the same for all objects related through the field
+            field_cells_html = (
+                f'<td>{escape(field.model._meta.app_label)}</td>'
+                f'<td>{escape(model_verbose_name)}</td>'
+                f'<td>{escape(field_verbose_name)}</td>'
+            )
+            # resolve the change url once, only the pk differs between objects
+            try:
+                admin_url_template = reverse(
+                    f'admin:{field.model._meta.app_label}_{field.model._meta.model_name}_change',
+                    args=(PK_PLACEHOLDER,),
+                )
+            except NoReverseMatch:
+                admin_url_template = None
+            related_objects = field.model._default_manager.filter(
+                **{field.name: obj},
+            ).iterator(chunk_size=200)
             for related_object in related_objects:
-                try:
-                    object_admin_url = reverse(
-                        f'admin:{related_object._meta.app_label}_{related_object._meta.model_name}_change',
-                        args=(related_object.pk,),
-                    )
-                except NoReverseMatch:
-                    object_link = format_html(
-                        '<span>{related_object}</span>',
-                        related_object=related_object,
-                    )
+                if admin_url_template is None:
+                    object_link = f'<span>{escape(related_object)}</span>'
                 else:
-                    object_link = format_html(
-                        '<a href="{object_admin_url}">{related_object}</a>',
-                        object_admin_url=object_admin_url,
-                        related_object=related_object,
+                    object_admin_url = admin_url_template.replace(
+                        PK_PLACEHOLDER,
+                        # the same quoting reverse() would apply
+                        quote(str(related_object.pk), safe=RFC3986_SUBDELIMS + '/~:@'),
                     )
-                row_html = format_html(
-                    (
-                        '<tr>'
-                        '<td>{related_app}</td>'
-                        '<td>{related_model}</td>'
-                        '<td>{related_field}</td>'
-                        '<td>{related_object}</td>'
-                        '</tr>'
-                    ),
-                    related_app=related_object._meta.app_label,
-                    related_model=related_object._meta.verbose_name,
-                    related_field=field.verbose_name,
-                    related_object=object_link,
-                )
-                rows_html.append(row_html)
-        return format_html_join(
-            '',
-            (
-                '<table>'
-                '<thead><tr>'
-                '<th>App</th>'
-                '<th>Model</th>'
-                '<th>Field</th>'
-                '<th>Object</th>'
-                '</tr></thead>'
-                '<tbody>{}</tbody>'
-                '</table>'
-            ),
-            ((row,) for row in rows_html),
+                    object_link = f'<a href="{escape(object_admin_url)}">{escape(related_object)}</a>'
+                rows_html.append(f'<tr>{field_cells_html}<td>{object_link}</td></tr>')
+        if not rows_html:
+            return ''
+        return mark_safe(  # all values are escaped above
+            '<table>'
+            '<thead><tr>'
+            '<th>App</th>'
+            '<th>Model</th>'
+            '<th>Field</th>'
+            '<th>Object</th>'
+            '</tr></thead>'
+            '<tbody>' + ''.join(rows_html) + '</tbody>'
+            '</table>'
         )
 
     @action(label=_('Unblock / retry'), methods=['POST'], button_type='form')
@@ -196,6 +244,15 @@ class GoalAdmin(DjangoObjectActions, admin.ModelAdmin):
         else:
             self.message_user(request, _('Goal was unblocked'))
 
+    @admin.action(description=_('Unblock / retry selected goals'))
+    def unblock_retry_selected(self, request, queryset):
+        unblocked_count = len(unblock_retry_goals(queryset.values('id')))
+        self.message_user(request, ngettext(
+            '%(count)d goal was unblocked',
+            '%(count)d goals were unblocked',
+            unblocked_count,
+        ) % {'count': unblocked_count})
+
     @action(label=_('Block'), methods=['POST'], button_type='form')
     def block(self, request, obj):
         try:
@@ -204,3 +261,41 @@ class GoalAdmin(DjangoObjectActions, admin.ModelAdmin):
             self.message_user(request, str(e), level=messages.ERROR)
         else:
             self.message_user(request, _('Goal was blocked'))
+
+
+@functools.lru_cache(maxsize=None)
+def _external_relation_fields(model):
+    """
+    Fields of other apps' models pointing to the model, along with their display names.
+    Relation tree doesn't change once apps are loaded, so it's cached for the process lifetime.
+    """
+    return tuple(
+        (field, field.verbose_name, field.model._meta.verbose_name)
+        for field in model._meta._relation_tree
+        if field.model._meta.app_label != 'django_goals'
+    )
+
+
+def _relation_fields_in_use(relation_fields, obj):
+    """
+    Narrow relation fields to the ones having any objects related to obj.
+    All fields are probed in a single UNION ALL query, so we don't query each model separately
+    only to find out most of them have nothing to show.
+    """
+    if len(relation_fields) < 2:
+        return relation_fields
+    probes = [
+        field.model._default_manager.filter(**{field.name: obj}).values(
+            relation_index=models.Value(i, output_field=models.IntegerField()),
+        )[:1]
+        for i, (field, _, _) in enumerate(relation_fields)
+    ]
+    in_use = {
+        row['relation_index']
+        for row in probes[0].union(*probes[1:], all=True)
+    }
+    return [
+        relation_field
+        for i, relation_field in enumerate(relation_fields)
+        if i in in_use
+    ]
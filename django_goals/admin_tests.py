@@ -1,10 +1,21 @@
+import datetime
+
 import pytest
+from django.contrib.messages import get_messages
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from django_goals.admin import LatestProgressFormSet
+from django_goals.factories import GoalFactory, GoalProgressFactory
+from django_goals.models import Goal, GoalProgress, GoalState
+from example_app.models import GoalRelatedModel, MergeSort, PartitionSort
 
-from django_goals.models import GoalState
+
+pytestmark = pytest.mark.django_db
 
 
-@pytest.mark.django_db
 @pytest.mark.parametrize(
     ('goal', 'action', 'expected_state'),
     [
@@ -30,6 +41,7 @@ from django_goals.models import GoalState
         ),
     ],
     indirect=['goal'],
+    ids=['block', 'unblock', 'retry-given-up', 'retry-not-going-to-happen-soon'],
 )
 def test_state_actions(admin_client, goal, action, expected_state):
     response = admin_client.post(reverse(
@@ -39,3 +51,124 @@ def test_state_actions(admin_client, goal, action, expected_state):
     assert response.status_code == 302
     goal.refresh_from_db()
     assert goal.state == expected_state
+
+
+def test_unblock_retry_selected_action(admin_client):
+    goals = [
+        GoalFactory(state=GoalState.GIVEN_UP),
+        GoalFactory(state=GoalState.BLOCKED),
+        GoalFactory(state=GoalState.ACHIEVED),
+    ]
+    response = admin_client.post(reverse('admin:django_goals_goal_changelist'), {
+        'action': 'unblock_retry_selected',
+        '_selected_action': [goal.pk for goal in goals],
+    })
+    assert response.status_code == 302
+    assert [Goal.objects.get(pk=goal.pk).state for goal in goals] == [
+        GoalState.WAITING_FOR_DATE,
+        GoalState.WAITING_FOR_DATE,
+        GoalState.ACHIEVED,
+    ]
+    assert [str(m) for m in get_messages(response.wsgi_request)] == ['2 goals were unblocked']
+
+
+def test_change_view_dependencies_query_count(admin_client, goal):
+    url = reverse('admin:django_goals_goal_change', args=[goal.pk])
+    admin_client.get(url)  # warm up caches, e.g. content types
+
+    goal.precondition_goals.add(GoalFactory())
+    with CaptureQueriesContext(connection) as single_dependency:
+        response = admin_client.get(url)
+    assert response.status_code == 200
+
+    goal.precondition_goals.add(*GoalFactory.create_batch(5))
+    with CaptureQueriesContext(connection) as many_dependencies:
+        response = admin_client.get(url)
+    assert response.status_code == 200
+
+    assert len(many_dependencies) == len(single_dependency)
+
+
+def test_change_view_related_objects(admin_client, goal):
+    related = GoalRelatedModel.objects.bulk_create([
+        GoalRelatedModel(goal=goal) for _ in range(3)
+    ])
+    merge_sort = MergeSort.objects.create(numbers=[1], goal=goal)
+    PartitionSort.objects.create(numbers=[1])  # not related to the goal
+    url = reverse('admin:django_goals_goal_change', args=[goal.pk])
+
+    with CaptureQueriesContext(connection) as queries:
+        response = admin_client.get(url)
+    assert response.status_code == 200
+    content = response.content.decode()
+    for related_object in related:
+        assert f'<span>{related_object}</span>' in content
+    merge_sort_url = reverse('admin:example_app_mergesort_change', args=[merge_sort.pk])
+    assert f'<a href="{merge_sort_url}">{merge_sort}</a>' in content
+    # related models with no objects are only probed together with others
+    assert not any(
+        'example_app_partitionsort' in query['sql'] and 'UNION ALL' not in query['sql']
+        for query in queries
+    )
+
+
+def test_changelist_progress_count(admin_client):
+    goals = GoalFactory.create_batch(2)
+    GoalProgressFactory.create_batch(3, goal=goals[0])
+    response = admin_client.get(reverse('admin:django_goals_goal_changelist'))
+    assert response.status_code == 200
+    progress_counts = {
+        goal.id: goal.progress_count
+        for goal in response.context['cl'].result_list
+    }
+    assert progress_counts == {goals[0].id: 3, goals[1].id: 0}
+
+
+def test_progress_changelist_filtered_by_goal(admin_client, goal):
+    progress = GoalProgressFactory.create_batch(2, goal=goal)
+    GoalProgressFactory()  # other goal's progress
+
+    response = admin_client.get(reverse('admin:django_goals_goal_change', args=[goal.pk]))
+    assert response.status_code == 200
+    progress_url = f'{reverse("admin:django_goals_goalprogress_changelist")}?goal_id={goal.pk}'
+    assert progress_url in response.content.decode()
+
+    response = admin_client.get(progress_url)
+    assert response.status_code == 200
+    assert set(response.context['cl'].result_list) == set(progress)
+
+
+def test_change_view_shows_latest_progress(admin_client, goal):
+    now = timezone.now()
+    progress = [
+        GoalProgressFactory(goal=goal, created_at=now - datetime.timedelta(minutes=i))
+        for i in range(LatestProgressFormSet.max_shown + 5)
+    ]
+    response = admin_client.get(reverse('admin:django_goals_goal_change', args=[goal.pk]))
+    assert response.status_code == 200
+    progress_formset = next(
+        formset for formset in response.context['inline_admin_formsets']
+        if formset.formset.model is GoalProgress
+    )
+    shown = [form.instance for form in progress_formset.formset]
+    assert shown == progress[:LatestProgressFormSet.max_shown]
+
+
+def test_changelist_defers_instructions(admin_client):
+    GoalFactory(instructions={'args': ['x' * 1000]})
+    response = admin_client.get(reverse('admin:django_goals_goal_changelist'))
+    assert response.status_code == 200
+    goal = response.context['cl'].result_list[0]
+    assert 'instructions' in goal.get_deferred_fields()
+
+
+@pytest.mark.parametrize('progress_count', [0, 1])
+def test_change_view_progress_inline_only_with_progress(admin_client, goal, progress_count):
+    GoalProgressFactory.create_batch(progress_count, goal=goal)
+    response = admin_client.get(reverse('admin:django_goals_goal_change', args=[goal.pk]))
+    assert response.status_code == 200
+    inline_models = [
+        formset.formset.model
+        for formset in response.context['inline_admin_formsets']
+    ]
+    assert (GoalProgress in inline_models) is (progress_count > 0)
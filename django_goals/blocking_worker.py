@@ -2,6 +2,7 @@ import logging
 
 from django.db import connection
 
+from .limits import apply_memory_limit, install_time_limit_handler
 from .models import handle_waiting_for_worker
 from .notifications import listen_goal_waiting_for_worker
 
@@ -13,22 +14,28 @@ def worker():
     '''
     This worker is a blocking worker that listens for notifications on the
     goal_waiting_for_worker channel. It will then handle the waiting for worker
-    jobs. This worker will run indefinitely until it is stopped.
+    jobs, a burst of notifications at a time. This worker will run indefinitely
+    until it is stopped.
     '''
+    handle = handle_waiting_for_worker  # local name, looked up in hot loops below
     logger.info("Blocking worker started, registering listener (goal_waiting_for_worker)")
+    apply_memory_limit()
+    install_time_limit_handler()
     listen_goal_waiting_for_worker()
 
     logger.info("Executing work ready before we were listening")
-    while True:
-        did_a_thing = handle_waiting_for_worker()
-        if not did_a_thing:
-            break
+    while handle():
+        pass
 
     logger.info("Handling notifications")
     pg_conn = connection.connection
-    for _ in pg_conn.notifies():
-        # We might pick a different job than the one that was notified.
-        # This is okay, because there are as many (or more) notifications as there are jobs.
-        handle_waiting_for_worker()
-
-    logger.info("Blocking worker exiting now")
+    while True:
+        # Block until something is announced.
+        for _ in pg_conn.notifies(stop_after=1):
+            pass
+        # Notifications come in bursts and there are as many (or more) of them as there are jobs.
+        # Drop the ones already delivered and serve the whole burst by handling until no job is left.
+        for _ in pg_conn.notifies(timeout=0):
+            pass
+        while handle():
+            pass
@@ -25,4 +25,6 @@ def get_notifications_fixture():
             call[0][0]
             for call in handler.call_args_list
         ]
-    return _get_notifications
+    yield _get_notifications
+    # the connection outlives the test, don't let handlers pile up on it
+    pg_conn.remove_notify_handler(handler)
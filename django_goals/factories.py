@@ -1,4 +1,5 @@
 import factory
+from django.db import models
 
 from .models import Goal, GoalProgress
 
@@ -20,6 +21,19 @@ class GoalFactory(factory.django.DjangoModelFactory):
 class GoalProgressFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = GoalProgress
+        skip_postgeneration_save = True
 
     goal = factory.SubFactory(GoalFactory)
     success = True
+
+    @factory.post_generation
+    def update_goal_progress_count(self, create, extracted, **kwargs):
+        if not create:
+            return
+        failure_change = 0 if self.success else 1
+        Goal.objects.filter(id=self.goal_id).update(
+            progress_count=models.F('progress_count') + 1,
+            failure_count=models.F('failure_count') + failure_change,
+        )
+        self.goal.progress_count += 1
+        self.goal.failure_count += failure_change
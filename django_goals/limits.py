@@ -1,11 +1,28 @@
 import gc
+import logging
 import resource
 import signal
+import threading
 from contextlib import contextmanager
 
 from django.conf import settings
 
 
+logger = logging.getLogger(__name__)
+
+
+def apply_memory_limit():
+    """
+    Apply the memory limit to the whole process.
+    Workers do it once at startup, so `limit_memory` doesn't need to set and restore it for every goal.
+    """
+    limit_mib = getattr(settings, 'GOALS_MEMORY_LIMIT_MIB', None)
+    if limit_mib is None:
+        return
+    _, limit_hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (limit_mib * 1024 * 1024, limit_hard))
+
+
 @contextmanager
 def limit_memory():
     limit_mib = getattr(settings, 'GOALS_MEMORY_LIMIT_MIB', None)
@@ -13,14 +30,18 @@ def limit_memory():
         yield
         return
     original_limit_soft, original_limit_hard = resource.getrlimit(resource.RLIMIT_AS)
+    # the limit may be already applied process-wide
+    swap_limit = original_limit_soft != limit_mib * 1024 * 1024
     try:
-        resource.setrlimit(resource.RLIMIT_AS, (limit_mib * 1024 * 1024, original_limit_hard))
+        if swap_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (limit_mib * 1024 * 1024, original_limit_hard))
         yield
     except MemoryError:
         gc.collect()
         raise
     finally:
-        resource.setrlimit(resource.RLIMIT_AS, (original_limit_soft, original_limit_hard))
+        if swap_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (original_limit_soft, original_limit_hard))
 
 
 class TimesUp(Exception):
@@ -31,16 +52,35 @@ def sigalrm_handler(signum, frame):
     raise TimesUp()
 
 
+def install_time_limit_handler():
+    """
+    Install SIGALRM handler for the process.
+    Workers do it once at startup, so `limit_time` only needs to arm the timer for every goal.
+    Signals are delivered to the main thread only, so the limit is not enforced in other threads.
+    """
+    if getattr(settings, 'GOALS_TIME_LIMIT_SECONDS', None) is None:
+        return
+    if not _in_main_thread():
+        logger.warning('Time limit is not enforced for goals pursued outside the main thread')
+        return
+    previous_handler = signal.signal(signal.SIGALRM, sigalrm_handler)
+    assert previous_handler in (signal.SIG_DFL, sigalrm_handler)
+
+
 @contextmanager
 def limit_time():
     seconds = getattr(settings, 'GOALS_TIME_LIMIT_SECONDS', None)
-    if seconds is None:
+    if seconds is None or not _in_main_thread():
         yield
         return
-    previous_handler = signal.signal(signal.SIGALRM, sigalrm_handler)
-    assert previous_handler in (signal.SIG_DFL, sigalrm_handler)
+    if signal.getsignal(signal.SIGALRM) is not sigalrm_handler:
+        install_time_limit_handler()
     try:
-        signal.alarm(seconds)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
         yield
     finally:
-        signal.alarm(0)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _in_main_thread():
+    return threading.current_thread() is threading.main_thread()
@@ -0,0 +1,29 @@
+import resource
+from unittest import mock
+
+from .limits import limit_memory
+
+
+def test_limit_memory_already_applied(settings):
+    settings.GOALS_MEMORY_LIMIT_MIB = 64
+    with (
+        mock.patch('resource.getrlimit', return_value=(64 * 1024 * 1024, resource.RLIM_INFINITY)),
+        mock.patch('resource.setrlimit') as setrlimit,
+        limit_memory(),
+    ):
+        pass
+    assert setrlimit.call_count == 0
+
+
+def test_limit_memory_applied_for_goal(settings):
+    settings.GOALS_MEMORY_LIMIT_MIB = 64
+    with (
+        mock.patch('resource.getrlimit', return_value=(resource.RLIM_INFINITY, resource.RLIM_INFINITY)),
+        mock.patch('resource.setrlimit') as setrlimit,
+        limit_memory(),
+    ):
+        pass
+    assert setrlimit.call_args_list == [
+        mock.call(resource.RLIMIT_AS, (64 * 1024 * 1024, resource.RLIM_INFINITY)),
+        mock.call(resource.RLIMIT_AS, (resource.RLIM_INFINITY, resource.RLIM_INFINITY)),
+    ]
@@ -10,6 +10,8 @@ from django_goals.models import worker
 
 logger = logging.getLogger(__name__)
 
+SIGNAL_NAMES = {int(signum): signum.name for signum in signal.Signals}
+
 
 class Command(BaseCommand):
     help = 'Run the worker'
@@ -32,7 +34,7 @@ def stop_signal_handler():
     stop_event = threading.Event()
 
     def handler(signum, frame):
-        signal_str = signal.Signals(signum).name
+        signal_str = SIGNAL_NAMES.get(signum, str(signum))
         logger.info('Received signal %s, stopping', signal_str)
         stop_event.set()
 
@@ -1,6 +1,11 @@
+import signal
+
 import pytest
 from django.core.management import call_command
 
+from django_goals.management.commands.goals_busy_worker import (
+    stop_signal_handler,
+)
 from django_goals.models import (
     AllDone, Goal, GoalProgress, GoalState, RetryMeLater, schedule,
 )
@@ -30,3 +35,10 @@ def test_max_transitions_in_single_turn():
     call_command('goals_busy_worker', max_progress_count=5)
     assert Goal.objects.filter(state=GoalState.ACHIEVED).count() == 5
     assert GoalProgress.objects.count() == 5
+
+
+def test_stop_signal_handler():
+    with stop_signal_handler() as stop_event:
+        assert not stop_event.is_set()
+        signal.raise_signal(signal.SIGTERM)
+        assert stop_event.is_set()
@@ -1,10 +1,10 @@
-import uuid
-
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 
 from django_goals.models import (
-    NOT_GOING_TO_HAPPEN_SOON_STATES, Goal, GoalState, PreconditionsMode,
+    NOT_GOING_TO_HAPPEN_SOON_STATES, Goal, GoalDependency, GoalProgress,
+    GoalState, PreconditionsMode,
 )
 
 
@@ -12,62 +12,138 @@ class Command(BaseCommand):
     """
     Check and fix the integrity of the goals system.
     """
-    def handle(self, *args, **options):
-        check_fix_all()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of goals checked in a single transaction',
+        )
+
+    def handle(self, *args, batch_size, **options):
+        check_fix_all(batch_size=batch_size)
 
 
-def check_fix_all():
-    goal_id = uuid.UUID(int=0)
+def check_fix_all(batch_size=500):
+    goal_id = None
     i = 0
     while True:
-        goal_id = check_fix_goal(goal_id)
+        goal_id, checked_count = check_fix_goals(goal_id, batch_size)
         if not goal_id:
             break
 
-        i += 1
+        i += checked_count
         if i >= 1000:
             print(i, goal_id)
             i = 0
 
-        goal_id = uuid.UUID(int=goal_id.int + 1)
-
 
 @transaction.atomic
-def check_fix_goal(goal_id):
-    goal = Goal.objects.filter(id__gte=goal_id).order_by('id').select_for_update(
+def check_fix_goals(after_goal_id, batch_size):
+    """
+    Recalculate waiting-for and progress counters of a batch of goals, following `after_goal_id` in id order.
+    Returns id of the last goal checked (or None if there was nothing to check)
+    and the number of goals checked.
+    """
+    goals_qs = Goal.objects.all()
+    if after_goal_id is not None:
+        goals_qs = goals_qs.filter(id__gt=after_goal_id)
+    goal_ids = list(goals_qs.order_by('id').select_for_update(
         no_key=True,
         skip_locked=True,
-    ).first()
-    if not goal:
-        return None
+    ).values_list('id', flat=True)[:batch_size])
+    if not goal_ids:
+        return None, 0
 
-    preconditions = list(goal.precondition_goals.all().select_for_update(
+    # lock preconditions, so their states don't change while we are counting
+    list(Goal.objects.filter(
+        id__in=GoalDependency.objects.filter(
+            dependent_goal_id__in=goal_ids,
+        ).values('precondition_goal_id'),
+    ).order_by('id').select_for_update(
         no_key=True,
-    ))
-    waiting_for_count = 0
-    waiting_for_failed_count = 0
-    for pre in preconditions:
-        if pre.state != GoalState.ACHIEVED:
-            waiting_for_count += 1
-        if pre.state in NOT_GOING_TO_HAPPEN_SOON_STATES:
-            waiting_for_failed_count += 1
-    waiting_for_not_achieved_count = waiting_for_count
-    if goal.preconditions_mode == PreconditionsMode.ANY:
-        waiting_for_count = min(1, waiting_for_count)
-
-    if waiting_for_count != goal.waiting_for_count:
-        print(f"Goal {goal_id} waiting_for count, DB={goal.waiting_for_count}, recalculated={waiting_for_count}")
-        goal.waiting_for_count = waiting_for_count
-        goal.save(update_fields=['waiting_for_count'])
-
-    if waiting_for_not_achieved_count != goal.waiting_for_not_achieved_count:
-        print(f"Goal {goal_id} waiting_for_not_achieved count, DB={goal.waiting_for_not_achieved_count}, recalculated={waiting_for_not_achieved_count}")
-        goal.waiting_for_not_achieved_count = waiting_for_not_achieved_count
-        goal.save(update_fields=['waiting_for_not_achieved_count'])
-
-    if waiting_for_failed_count != goal.waiting_for_failed_count:
-        print(f"Goal {goal_id} waiting_for_failed count, DB={goal.waiting_for_failed_count}, recalculated={waiting_for_failed_count}")
-        goal.waiting_for_failed_count = waiting_for_failed_count
-        goal.save(update_fields=['waiting_for_failed_count'])
-
-    return goal.id
+    ).values_list('id', flat=True))
+
+    goals = Goal.objects.filter(id__in=goal_ids).annotate(
+        recalculated_not_achieved_count=models.Count(
+            'precondition_goals',
+            filter=~models.Q(precondition_goals__state=GoalState.ACHIEVED),
+        ),
+        recalculated_failed_count=models.Count(
+            'precondition_goals',
+            filter=models.Q(precondition_goals__state__in=NOT_GOING_TO_HAPPEN_SOON_STATES),
+        ),
+        # subqueries, so progress rows don't multiply precondition rows counted above
+        recalculated_progress_count=_progress_count_subquery(),
+        recalculated_failure_count=_progress_count_subquery(success=False),
+    ).order_by('id').only(
+        'id',
+        'preconditions_mode',
+        'waiting_for_count',
+        'waiting_for_not_achieved_count',
+        'waiting_for_failed_count',
+        'progress_count',
+        'failure_count',
+    )
+
+    goals_to_fix = []
+    for goal in goals:
+        waiting_for_not_achieved_count = goal.recalculated_not_achieved_count
+        waiting_for_failed_count = goal.recalculated_failed_count
+        waiting_for_count = waiting_for_not_achieved_count
+        if goal.preconditions_mode == PreconditionsMode.ANY:
+            waiting_for_count = min(1, waiting_for_count)
+
+        fixed = False
+        if waiting_for_count != goal.waiting_for_count:
+            print(f"Goal {goal.id} waiting_for count, DB={goal.waiting_for_count}, recalculated={waiting_for_count}")
+            goal.waiting_for_count = waiting_for_count
+            fixed = True
+
+        if waiting_for_not_achieved_count != goal.waiting_for_not_achieved_count:
+            print(f"Goal {goal.id} waiting_for_not_achieved count, DB={goal.waiting_for_not_achieved_count}, recalculated={waiting_for_not_achieved_count}")
+            goal.waiting_for_not_achieved_count = waiting_for_not_achieved_count
+            fixed = True
+
+        if waiting_for_failed_count != goal.waiting_for_failed_count:
+            print(f"Goal {goal.id} waiting_for_failed count, DB={goal.waiting_for_failed_count}, recalculated={waiting_for_failed_count}")
+            goal.waiting_for_failed_count = waiting_for_failed_count
+            fixed = True
+
+        if goal.recalculated_progress_count != goal.progress_count:
+            print(f"Goal {goal.id} progress count, DB={goal.progress_count}, recalculated={goal.recalculated_progress_count}")
+            goal.progress_count = goal.recalculated_progress_count
+            fixed = True
+
+        if goal.recalculated_failure_count != goal.failure_count:
+            print(f"Goal {goal.id} failure count, DB={goal.failure_count}, recalculated={goal.recalculated_failure_count}")
+            goal.failure_count = goal.recalculated_failure_count
+            fixed = True
+
+        if fixed:
+            goals_to_fix.append(goal)
+
+    Goal.objects.bulk_update(goals_to_fix, fields=[
+        'waiting_for_count',
+        'waiting_for_not_achieved_count',
+        'waiting_for_failed_count',
+        'progress_count',
+        'failure_count',
+    ])
+
+    return goal_ids[-1], len(goal_ids)
+
+
+def _progress_count_subquery(**filters):
+    return Coalesce(
+        models.Subquery(
+            GoalProgress.objects.filter(
+                goal=models.OuterRef('pk'),
+                **filters,
+            ).order_by().values('goal').annotate(
+                count=models.Count('*'),
+            ).values('count'),
+            output_field=models.IntegerField(),
+        ),
+        0,
+    )
@@ -2,7 +2,7 @@ import pytest
 from django.core.management import call_command
 
 from django_goals.factories import GoalFactory
-from django_goals.models import GoalState, PreconditionsMode
+from django_goals.models import GoalProgress, GoalState, PreconditionsMode
 
 
 @pytest.mark.django_db
@@ -12,11 +12,15 @@ def test_goals_fsck(goal):
         GoalFactory(state=GoalState.WAITING_FOR_WORKER),
         GoalFactory(state=GoalState.NOT_GOING_TO_HAPPEN_SOON),
     )
+    GoalProgress.objects.create(goal=goal, success=True)
+    GoalProgress.objects.create(goal=goal, success=False)
     call_command('goals_fsck')
     goal.refresh_from_db()
     assert goal.waiting_for_count == 2
     assert goal.waiting_for_not_achieved_count == 2
     assert goal.waiting_for_failed_count == 1
+    assert goal.progress_count == 2
+    assert goal.failure_count == 1
 
 
 @pytest.mark.django_db
@@ -33,3 +37,15 @@ def test_goals_fsck_any_mode(goal):
     assert goal.waiting_for_count == 1
     assert goal.waiting_for_not_achieved_count == 3
     assert goal.waiting_for_failed_count == 1
+
+
+@pytest.mark.django_db
+def test_goals_fsck_in_batches():
+    preconds = GoalFactory.create_batch(3, state=GoalState.WAITING_FOR_WORKER)
+    goals = GoalFactory.create_batch(5, precondition_goals=preconds, waiting_for_count=7)
+    call_command('goals_fsck', batch_size=2)
+    for goal in goals:
+        goal.refresh_from_db()
+        assert goal.waiting_for_count == 3
+        assert goal.waiting_for_not_achieved_count == 3
+        assert goal.waiting_for_failed_count == 0
@@ -1,7 +1,9 @@
 import logging
 import threading
+import time
 
 from django.core.management.base import BaseCommand
+from django.db import connection
 
 from django_goals.models import worker
 
@@ -10,6 +12,10 @@ from .goals_busy_worker import stop_signal_handler
 
 logger = logging.getLogger(__name__)
 
+# Pause before restarting a failed worker, so a persistent failure (e.g. database being down)
+# doesn't turn into a busy loop
+WORKER_RESTART_DELAY_SECONDS = 1
+
 
 class Command(BaseCommand):
     help = 'Run the worker'
@@ -53,6 +59,13 @@ class WorkerThread(threading.Thread):
         self.once = once
 
     def run(self):
+        try:
+            self.run_worker()
+        finally:
+            # each thread has its own connection, don't leave it to the garbage collector
+            connection.close()
+
+    def run_worker(self):
         while (
             self.stop_event is None or
             not self.stop_event.is_set()
@@ -64,5 +77,15 @@ class WorkerThread(threading.Thread):
                 )
             except Exception as e:
                 logger.exception(e)
+                # reconnect when the worker is restarted, instead of failing on a broken connection again
+                connection.close_if_unusable_or_obsolete()
+                if not self.once:
+                    self.wait_before_restart()
             if self.once:
                 break
+
+    def wait_before_restart(self):
+        if self.stop_event is None:
+            time.sleep(WORKER_RESTART_DELAY_SECONDS)
+        else:
+            self.stop_event.wait(WORKER_RESTART_DELAY_SECONDS)
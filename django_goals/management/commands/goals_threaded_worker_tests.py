@@ -1,7 +1,15 @@
+import threading
+import time
+from unittest import mock
+
 import pytest
 from django.core.management import call_command
+from django.db import OperationalError
 
-from django_goals.models import AllDone, GoalState, schedule
+from django_goals.management.commands.goals_threaded_worker import (
+    threaded_worker,
+)
+from django_goals.models import AllDone, GoalState, schedule, worker
 
 
 def achieve(goal):
@@ -14,3 +22,57 @@ def test_achieving_goals():
     call_command('goals_threaded_worker', threads=2, once=True)
     goal.refresh_from_db()
     assert goal.state == GoalState.ACHIEVED
+
+
+@pytest.mark.django_db(transaction=True)
+def test_achieving_goals_with_time_limit(settings):
+    # signal handlers can't be installed outside the main thread, the limit is not enforced there
+    settings.GOALS_TIME_LIMIT_SECONDS = 1
+    goal = schedule(achieve)
+    with mock.patch(
+        'django_goals.management.commands.goals_threaded_worker.worker',
+        wraps=worker,
+    ) as worker_mock:
+        call_command('goals_threaded_worker', threads=2, once=True)
+    assert worker_mock.call_count == 2
+    goal.refresh_from_db()
+    assert goal.state == GoalState.ACHIEVED
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_failure_drops_unusable_connection():
+    goal = schedule(achieve)
+    with mock.patch(
+        'django_goals.management.commands.goals_threaded_worker.worker',
+        side_effect=OperationalError('connection lost'),
+    ), mock.patch(
+        'django.db.backends.base.base.BaseDatabaseWrapper.close_if_unusable_or_obsolete',
+    ) as close_if_unusable:
+        call_command('goals_threaded_worker', once=True)
+    assert close_if_unusable.call_count == 1
+    call_command('goals_threaded_worker', once=True)
+    goal.refresh_from_db()
+    assert goal.state == GoalState.ACHIEVED
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_failure_restarts_with_delay():
+    stop_event = threading.Event()
+    call_times = []
+
+    def failing_worker(**kwargs):
+        call_times.append(time.monotonic())
+        if len(call_times) == 2:
+            stop_event.set()
+        raise OperationalError('connection lost')
+
+    with mock.patch(
+        'django_goals.management.commands.goals_threaded_worker.worker',
+        side_effect=failing_worker,
+    ), mock.patch(
+        'django_goals.management.commands.goals_threaded_worker.WORKER_RESTART_DELAY_SECONDS',
+        0.2,
+    ):
+        threaded_worker(stop_event=stop_event, once=False)
+    assert len(call_times) == 2
+    assert call_times[1] - call_times[0] >= 0.2
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_goals', '0009_goal_waiting_for_not_achieved_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goal',
+            name='progress_count',
+            field=models.IntegerField(default=0, help_text='Number of progress records of the goal.'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE django_goals_goal SET progress_count = progress.count
+                FROM (
+                    SELECT goal_id, COUNT(*) AS count FROM django_goals_goalprogress GROUP BY goal_id
+                ) AS progress
+                WHERE django_goals_goal.id = progress.goal_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
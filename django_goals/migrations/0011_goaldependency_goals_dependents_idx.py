@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_goals', '0010_goal_progress_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goaldependency',
+            index=models.Index(fields=['precondition_goal', 'dependent_goal'], name='goals_dependents_idx'),
+        ),
+        migrations.AlterField(
+            model_name='goaldependency',
+            name='precondition_goal',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='dependents', to='django_goals.goal'),
+        ),
+    ]
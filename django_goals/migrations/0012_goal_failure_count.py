@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_goals', '0011_goaldependency_goals_dependents_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goal',
+            name='failure_count',
+            field=models.IntegerField(default=0, help_text='Number of failed progress records of the goal.'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE django_goals_goal SET failure_count = progress.count
+                FROM (
+                    SELECT goal_id, COUNT(*) AS count FROM django_goals_goalprogress
+                    WHERE NOT success
+                    GROUP BY goal_id
+                ) AS progress
+                WHERE django_goals_goal.id = progress.goal_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
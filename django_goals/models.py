@@ -1,20 +1,29 @@
 import datetime
+import functools
 import inspect
+import json
 import logging
 import threading
 import time
 import uuid
+from importlib import import_module
 
 from django.conf import settings
+from django.core.exceptions import EmptyResultSet
 from django.db import connections, models, transaction
-from django.db.models.functions import Least
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.utils.module_loading import import_string
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
-from .limits import limit_memory, limit_time
+from .limits import (
+    apply_memory_limit, install_time_limit_handler, limit_memory, limit_time,
+)
 from .notifications import (
-    listen_goal_progress, notify_goal_progress, notify_goal_waiting_for_worker,
+    drain_goal_waiting_for_worker, listen_goal_progress,
+    listen_goal_waiting_for_worker, notify_goal_progress,
+    notify_goal_waiting_for_worker, notify_goals_waiting_for_worker,
+    wait_goal_waiting_for_worker,
 )
 
 
@@ -108,6 +117,14 @@ class Goal(models.Model):
         default=timezone.now,
         help_text=_('Goals having deadline sooner will be pursued first.'),
     )
+    progress_count = models.IntegerField(
+        default=0,
+        help_text=_('Number of progress records of the goal.'),
+    )
+    failure_count = models.IntegerField(
+        default=0,
+        help_text=_('Number of failed progress records of the goal.'),
+    )
     created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
@@ -159,6 +176,13 @@ class Goal(models.Model):
     def __str__(self):
         return f'{self.handler} ({self.state})'
 
+    @cached_property
+    def instructions_pretty(self):
+        """
+        Instructions rendered as indented JSON, for display purposes.
+        """
+        return json.dumps(self.instructions, indent=2)
+
 
 class GoalDependency(models.Model):
     """
@@ -175,12 +199,19 @@ class GoalDependency(models.Model):
         to=Goal,
         on_delete=models.PROTECT,
         related_name='dependents',
+        db_index=False,  # covered by goals_dependents_idx
     )
 
     class Meta:
         unique_together = (
             ('dependent_goal', 'precondition_goal'),
         )
+        indexes = [
+            models.Index(  # for finding dependents of goals without visiting the table
+                fields=['precondition_goal', 'dependent_goal'],
+                name='goals_dependents_idx',
+            ),
+        ]
 
 
 class GoalProgress(models.Model):
@@ -222,6 +253,23 @@ def unblock_retry_goal(goal_id):
     return goal
 
 
+@transaction.atomic
+def unblock_retry_goals(goal_ids):
+    """
+    Mark many goals as unblocked at once, so they can be pursued again.
+    Goals that are not blocked or failed are skipped.
+    Returns ids of goals that were unblocked.
+    """
+    unblocked_ids = list(Goal.objects.filter(
+        id__in=goal_ids,
+        state__in=NOT_GOING_TO_HAPPEN_SOON_STATES,
+    ).order_by('id').select_for_update(  # consistent locking order
+        no_key=True,
+    ).values_list('id', flat=True))
+    _mark_as_unfailed(unblocked_ids)
+    return unblocked_ids
+
+
 def _mark_as_failed(goal_ids, target_state):
     """
     All goal must be in waititng state.
@@ -230,13 +278,7 @@ def _mark_as_failed(goal_ids, target_state):
     assert target_state in NOT_GOING_TO_HAPPEN_SOON_STATES
     if not goal_ids:
         return
-    Goal.objects.filter(id__in=goal_ids).update(state=target_state)
-    # update waiting-for failed count in dependent goals
-    Goal.objects.filter(
-        precondition_goals__id__in=goal_ids,
-    ).update(
-        waiting_for_failed_count=models.F('waiting_for_failed_count') + 1,
-    )
+    _set_state_and_update_dependents(goal_ids, target_state, failed_count_change=1)
 
 
 def _mark_as_unfailed(goal_ids):
@@ -246,15 +288,55 @@ def _mark_as_unfailed(goal_ids):
     """
     if not goal_ids:
         return
-    Goal.objects.filter(id__in=goal_ids).update(state=GoalState.WAITING_FOR_DATE)
-    # update waiting-for failed count in dependent goals
+    _set_state_and_update_dependents(goal_ids, GoalState.WAITING_FOR_DATE, failed_count_change=-1)
+
+
+def _set_state_and_update_dependents(goal_ids, target_state, failed_count_change):
+    """
+    Set state of the goals and update waiting-for failed count in their dependent goals,
+    by `failed_count_change` for each of the goals being a precondition.
+    It's a single UPDATE, so a goal that is both in goal_ids and dependent on some of them
+    gets both changes.
+    """
+    goal_ids = list(goal_ids)
+    dependent_goal_ids = GoalDependency.objects.filter(
+        precondition_goal__in=goal_ids,
+    ).values('dependent_goal')
     Goal.objects.filter(
-        precondition_goals__id__in=goal_ids,
+        models.Q(id__in=goal_ids) | models.Q(id__in=dependent_goal_ids),
     ).update(
-        waiting_for_failed_count=models.F('waiting_for_failed_count') - 1,
+        state=models.Case(
+            models.When(id__in=goal_ids, then=models.Value(target_state)),
+            default=models.F('state'),
+        ),
+        waiting_for_failed_count=models.F('waiting_for_failed_count') + failed_count_change * Coalesce(
+            _preconditions_among(goal_ids),
+            0,
+        ),
     )
 
 
+def _preconditions_among(goal_ids):
+    """
+    Number of goal_ids that are preconditions of the goal being updated.
+    A dependent goal is updated once, even if many of goal_ids are its preconditions.
+    """
+    return models.Subquery(
+        GoalDependency.objects.filter(
+            dependent_goal=models.OuterRef('pk'),
+            precondition_goal__in=goal_ids,
+        ).order_by().values('dependent_goal').annotate(
+            count=models.Count('*'),
+        ).values('count'),
+        output_field=models.IntegerField(),
+    )
+
+
+# Bounds of the time an idle worker waits for a goal announcement before checking again
+IDLE_WAIT_MIN_SECONDS = 0.01
+IDLE_WAIT_MAX_SECONDS = 1
+
+
 def worker(stop_event=None, max_progress_count=float('inf'), once=False):
     """
     Worker is a busy-wait function that will keep checking for goals to pursue.
@@ -263,11 +345,17 @@ def worker(stop_event=None, max_progress_count=float('inf'), once=False):
     1. Check if there are goals that are waiting for date and the date has come.
     2. Check if there are goals that are waiting for preconditions and all preconditions are achieved.
     3. Check if there are goals that are waiting for worker and pick one to pursue.
-    4. If nothing could be done, sleep for a bit.
+    4. If nothing could be done, wait for a goal to become ready. The wait is short right after
+       some work was done and grows up to a second while the worker stays idle.
     5. Repeat until stop_event is set.
     """
     logger.info('Busy-wait worker started')
+    apply_memory_limit()
+    install_time_limit_handler()
+    listen_goal_waiting_for_worker()
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     progress_count = 0
+    idle_wait_seconds = IDLE_WAIT_MIN_SECONDS
     while (
         stop_event is None or
         not stop_event.is_set()
@@ -286,62 +374,111 @@ def worker(stop_event=None, max_progress_count=float('inf'), once=False):
             if once:
                 logger.info('Nothing to do, exiting because of `once` flag')
                 break
-            # nothing could be done, let's go to sleep
-            logger.debug('Nothing to do, sleeping for a bit')
-            time.sleep(1)
+            # Nothing could be done, let's wait for a goal to become ready.
+            # Other transitions (like waiting for date) are not announced, so we don't wait too long.
+            if debug_enabled:
+                logger.debug('Nothing to do, waiting for a bit')
+            wait_goal_waiting_for_worker(timeout=idle_wait_seconds)
+            idle_wait_seconds = min(idle_wait_seconds * 2, IDLE_WAIT_MAX_SECONDS)
+        else:
+            idle_wait_seconds = IDLE_WAIT_MIN_SECONDS
+            # goals announced while we were busy are picked up by the next turn anyway
+            drain_goal_waiting_for_worker()
 
     logger.info('Busy-wait worker exiting')
 
 
-def worker_turn(now=None, stop_event=None, max_progress_count=float('inf')):
+def worker_turn(now=None, stop_event=None, max_progress_count=float('inf'), force_remove_old_goals=False):
     """
     Worker turn is a single iteration of the worker.
     It will try to transition as many goals as possible.
+    Old goals are removed once in a while, unless `force_remove_old_goals` is set.
     Returns a number of transitions done (all state changes)
     and a number of progress transitions done (real handler calls).
     """
     if now is None:
         now = timezone.now()
     transitions_done = 0
-    transitions_done += handle_waiting_for_date(now)
-    transitions_done += handle_waiting_for_preconditions()
-    transitions_done += handle_waiting_for_failed_preconditions()
-    transitions_done += handle_unblocked_goals()
+    due_transitions = _due_state_transitions(now)
+    if due_transitions:
+        transitions_done += _handle_state_transitions(now, due_transitions, stop_event)
     progress_count = 0
+    batch_size = getattr(settings, 'GOALS_WORKER_BATCH_SIZE', 1)
     while (
         stop_event is None or
         not stop_event.is_set()
     ):
         if progress_count >= max_progress_count:
             break
-        did_a_thing = handle_waiting_for_worker()
-        if not did_a_thing:
+        progress = handle_waiting_for_worker_batch(
+            limit=min(batch_size, max_progress_count - progress_count),
+        )
+        if not progress:
             break
-        transitions_done += 1
-        progress_count += 1
-    remove_old_goals(now)
+        transitions_done += len(progress)
+        progress_count += len(progress)
+    if force_remove_old_goals or _is_old_goals_removal_due(now):
+        if _remove_old_goals_batches(now, stop_event):
+            thread_local.old_goals_removed_at = now
     return transitions_done, progress_count
 
 
-@transaction.atomic
+def _remove_old_goals_batches(now, stop_event):
+    """
+    Remove old goals in batches, but no more than OLD_GOALS_REMOVAL_MAX_BATCHES in one go,
+    so a big backlog doesn't hold up pursuing goals or stopping the worker.
+    Returns True if all old goals were removed.
+    """
+    for _batch in range(OLD_GOALS_REMOVAL_MAX_BATCHES):
+        if stop_event is not None and stop_event.is_set():
+            return False
+        if remove_old_goals(now) < OLD_GOALS_REMOVAL_BATCH_SIZE:
+            return True
+    return False
+
+
+def _is_old_goals_removal_due(now):
+    interval_seconds = getattr(settings, 'GOALS_CLEANUP_INTERVAL_SECONDS', 5 * 60)
+    return (
+        thread_local.old_goals_removed_at is None or
+        now - thread_local.old_goals_removed_at >= datetime.timedelta(seconds=interval_seconds)
+    )
+
+
+def _set_state_skip_locked(goals_qs, state):
+    """
+    Set state of the goals, skipping the ones locked by others, in a single UPDATE ... RETURNING.
+    Returns ids of the updated goals.
+    You must be in a transaction.
+    """
+    try:
+        select_sql, select_params = goals_qs.order_by().select_for_update(
+            skip_locked=True,
+            no_key=True,
+        ).values('id').query.sql_with_params()
+    except EmptyResultSet:
+        return []
+    with connections['default'].cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {Goal._meta.db_table} SET state = %s WHERE id IN ({select_sql}) RETURNING id',
+            [state, *select_params],
+        )
+        return [goal_id for goal_id, in cursor.fetchall()]
+
+
+@transaction.atomic(savepoint=False)
 def handle_waiting_for_date(now):
     """
     Transition goals that are waiting for precondition date and the date has come.
     """
-    qs = Goal.objects.filter(
+    ids = _set_state_skip_locked(Goal.objects.filter(
         state=GoalState.WAITING_FOR_DATE,
         precondition_date__lte=now,
-    ).select_for_update(
-        skip_locked=True,
-        no_key=True,
-    )
-    ids = list(qs.values_list('id', flat=True))
-    return Goal.objects.filter(
-        id__in=ids,
-    ).update(state=GoalState.WAITING_FOR_PRECONDITIONS)
+    ), GoalState.WAITING_FOR_PRECONDITIONS)
+    return len(ids)
 
 
-@transaction.atomic
+@transaction.atomic(savepoint=False)
 def handle_waiting_for_preconditions(goals_qs=None):
     """
     Transition goals that are waiting for precondition goals to be achieved
@@ -351,25 +488,19 @@ def handle_waiting_for_preconditions(goals_qs=None):
         goals_qs = Goal.objects.all()
     transitions_done = 0
 
-    new_waiting_for_worker = goals_qs.filter(
+    new_waiting_for_worker = _set_state_skip_locked(goals_qs.filter(
         state=GoalState.WAITING_FOR_PRECONDITIONS,
         waiting_for_count__lte=0,
-    ).select_for_update(
-        no_key=True,
-        skip_locked=True,
-    ).values_list('id', flat=True)
-    new_waiting_for_worker = list(new_waiting_for_worker)
+    ), GoalState.WAITING_FOR_WORKER)
     if new_waiting_for_worker:
-        Goal.objects.filter(id__in=new_waiting_for_worker).update(state=GoalState.WAITING_FOR_WORKER)
         with connections['default'].cursor() as cursor:
-            for goal_id in new_waiting_for_worker:
-                notify_goal_waiting_for_worker(cursor, goal_id)
+            notify_goals_waiting_for_worker(cursor, new_waiting_for_worker)
     transitions_done += len(new_waiting_for_worker)
 
     return transitions_done
 
 
-@transaction.atomic
+@transaction.atomic(savepoint=False)
 def handle_waiting_for_failed_preconditions():
     """
     if a goal is waiting for preconditions that are failed, it's not going to happen soon
@@ -380,7 +511,7 @@ def handle_waiting_for_failed_preconditions():
     new_failed = goals_qs.filter(
         state=GoalState.WAITING_FOR_PRECONDITIONS,
         waiting_for_failed_count__gt=0,
-    ).select_for_update(
+    ).order_by().select_for_update(
         no_key=True,
         skip_locked=True,
     ).values_list('id', flat=True)
@@ -391,7 +522,7 @@ def handle_waiting_for_failed_preconditions():
     return transitions_done
 
 
-@transaction.atomic
+@transaction.atomic(savepoint=False)
 def handle_unblocked_goals():
     """
     Transition goals that have no failed preconditions, yet are marked as not going to happen soon.
@@ -399,7 +530,7 @@ def handle_unblocked_goals():
     qs = Goal.objects.filter(
         state=GoalState.NOT_GOING_TO_HAPPEN_SOON,
         waiting_for_failed_count__lte=0,
-    ).select_for_update(
+    ).order_by().select_for_update(
         skip_locked=True,
         no_key=True,
     )
@@ -408,23 +539,124 @@ def handle_unblocked_goals():
     return len(ids)
 
 
+# Transitions done in each worker turn, after handling goals waiting for date
+STATE_TRANSITION_HANDLERS = (
+    handle_waiting_for_preconditions,
+    handle_waiting_for_failed_preconditions,
+    handle_unblocked_goals,
+)
+
+
 @transaction.atomic
-def handle_waiting_for_worker():
+def _handle_state_transitions(now, due_transitions, stop_event):
     """
-    Transition goals that are waiting for a worker to pick them up.
+    Run due state transition handlers. They share a single transaction, so there is one commit
+    per worker turn instead of one per handler. Handlers don't create savepoints when nested.
     """
-    now = timezone.now()
-    # Get the first goal that is waiting for a worker
-    goal = Goal.objects.filter(state=GoalState.WAITING_FOR_WORKER).order_by(
+    transitions_done = 0
+    if handle_waiting_for_date in due_transitions:
+        transitions_done += handle_waiting_for_date(now)
+        # goals that came to waiting for preconditions can move on in this very turn
+        due_transitions = STATE_TRANSITION_HANDLERS
+    for handle_transitions in STATE_TRANSITION_HANDLERS:
+        if stop_event is not None and stop_event.is_set():
+            break
+        if handle_transitions in due_transitions:
+            transitions_done += handle_transitions()
+    return transitions_done
+
+
+def _due_state_transitions(now):
+    """
+    Find out which state transition handlers have any goals to transition.
+    All of them are checked in a single UNION ALL query, so an idle worker turn
+    doesn't go through a transaction per handler only to find nothing to do.
+    Goals locked by other workers are not skipped here, so a handler may still find nothing.
+    """
+    checks = (
+        (handle_waiting_for_date, models.Q(
+            state=GoalState.WAITING_FOR_DATE,
+            precondition_date__lte=now,
+        )),
+        (handle_waiting_for_preconditions, models.Q(
+            state=GoalState.WAITING_FOR_PRECONDITIONS,
+            waiting_for_count__lte=0,
+        )),
+        (handle_waiting_for_failed_preconditions, models.Q(
+            state=GoalState.WAITING_FOR_PRECONDITIONS,
+            waiting_for_failed_count__gt=0,
+        )),
+        (handle_unblocked_goals, models.Q(
+            state=GoalState.NOT_GOING_TO_HAPPEN_SOON,
+            waiting_for_failed_count__lte=0,
+        )),
+    )
+    probes = [
+        Goal.objects.filter(condition).order_by().values(
+            transition_index=models.Value(i, output_field=models.IntegerField()),
+        )[:1]
+        for i, (_, condition) in enumerate(checks)
+    ]
+    return {
+        checks[row['transition_index']][0]
+        for row in probes[0].union(*probes[1:], all=True)
+    }
+
+
+def _waiting_for_worker_qs():
+    return Goal.objects.filter(state=GoalState.WAITING_FOR_WORKER).order_by(
         'deadline',
     ).select_for_update(
         skip_locked=True,
         no_key=True,
-    ).first()
+    )
+
+
+@transaction.atomic
+def handle_waiting_for_worker():
+    """
+    Transition goals that are waiting for a worker to pick them up.
+    """
+    # Get the first goal that is waiting for a worker
+    goal = _waiting_for_worker_qs().first()
     if goal is None:
         # nothing to do
         return None
+    progress = _pursue_goal(goal)
+    progress.save(force_insert=True)
+    return progress
+
 
+@transaction.atomic
+def handle_waiting_for_worker_batch(limit):
+    """
+    Like `handle_waiting_for_worker`, but picks up to `limit` goals with a single query
+    and pursues them one by one in a single transaction.
+    Goals stay locked until the whole batch is done, so this is suitable for short handlers.
+    Progress records of the batch are inserted with a single query.
+    Returns a list of progress records.
+    """
+    goals = list(_waiting_for_worker_qs()[:limit])
+    progress = []
+    for i, goal in enumerate(goals):
+        if i > 0:
+            # Handlers of earlier goals in the batch could have changed this one
+            # (e.g. achieved its precondition or blocked it), so don't trust the loaded state.
+            # We hold the lock, so the row can't change under us after the refresh.
+            goal.refresh_from_db()
+            if goal.state != GoalState.WAITING_FOR_WORKER:
+                continue
+        progress.append(_pursue_goal(goal))
+    return GoalProgress.objects.bulk_create(progress)
+
+
+def _pursue_goal(goal):
+    """
+    Call the goal handler and store the outcome in the goal.
+    Returns the progress record, which is not saved yet.
+    You must be in a transaction and have a lock on the goal.
+    """
+    now = timezone.now()
     if now < goal.precondition_date:
         logger.warning('Precondition date bug in goal %s. Precondition date is in the future', goal.id)
     if goal.preconditions_mode == PreconditionsMode.ALL:
@@ -449,8 +681,8 @@ def handle_waiting_for_worker():
         logger.exception('Goal %s failed', goal.id)
         success = False
         message = ''
-        failure_index = goal.progress.filter(success=False).count()
-        retry_delay = get_retry_delay(failure_index)
+        retry_delay = get_retry_delay(goal.failure_count)
+        goal.failure_count += 1
         if retry_delay is None:
             goal.state = GoalState.GIVEN_UP
         else:
@@ -484,25 +716,28 @@ def handle_waiting_for_worker():
     # decrease waiting-for counter in dependent goals
     if goal.state == GoalState.ACHIEVED:
         Goal.objects.filter(
-            precondition_goals=goal,
+            id__in=GoalDependency.objects.filter(precondition_goal=goal).values('dependent_goal'),
         ).update(
             waiting_for_count=models.F('waiting_for_count') - 1,
             waiting_for_not_achieved_count=models.F('waiting_for_not_achieved_count') - 1,
         )
 
-    progress = goal.progress.create(
+    progress = GoalProgress(
+        goal=goal,
         success=success,
         created_at=now,
         time_taken=datetime.timedelta(seconds=time_taken),
         message=message,
     )
+    # the goal is locked, so the counters can be incremented in python
+    goal.progress_count += 1
 
     # check max progress count
     max_progress_count = getattr(settings, 'GOALS_MAX_PROGRESS_COUNT', 100)
     if (
         max_progress_count is not None and
         goal.state != GoalState.ACHIEVED and
-        goal.progress.count() >= max_progress_count
+        goal.progress_count >= max_progress_count
     ):
         logger.warning('Goal %s reached max progress count, giving up', goal.id)
         goal.state = GoalState.GIVEN_UP
@@ -512,7 +747,7 @@ def handle_waiting_for_worker():
         # goal.state will be saved twice, but it's fine
         _mark_as_failed([goal.id], target_state=GoalState.GIVEN_UP)
 
-    goal.save(update_fields=['state', 'precondition_date'])
+    goal.save(update_fields=['state', 'precondition_date', 'progress_count', 'failure_count'])
     notify_goal_progress(goal.id, goal.state)
     return progress
 
@@ -520,6 +755,7 @@ def handle_waiting_for_worker():
 class GoalsThreadLocal(threading.local):
     def __init__(self):
         self.current_goal = None
+        self.old_goals_removed_at = None
 
 
 thread_local = GoalsThreadLocal()
@@ -534,7 +770,7 @@ def follow_instructions(goal):
     """
     Call the handler function with instructions.
     """
-    func = import_string(goal.handler)
+    func = _import_handler(goal.handler)
     instructions = goal.instructions
     if instructions is None:
         instructions = {}
@@ -552,6 +788,33 @@ def follow_instructions(goal):
         thread_local.current_goal = None
 
 
+def _import_handler(handler):
+    """
+    Like `import_string`, but the module is imported once per handler path.
+    The function is still looked up on every call, so handlers can be patched, e.g. in tests.
+    """
+    module, function_name = _import_handler_module(handler)
+    try:
+        return getattr(module, function_name)
+    except AttributeError as e:
+        raise ImportError(f'Module "{module.__name__}" does not define "{function_name}"') from e
+
+
+@functools.lru_cache(maxsize=512)
+def _import_handler_module(handler):
+    # import errors are not cached
+    module_path, function_name = handler.rsplit('.', 1)
+    return import_module(module_path), function_name
+
+
+@functools.lru_cache(maxsize=512)
+def _handler_name(func):
+    """
+    Dotted path of the handler function, as stored in `Goal.handler`.
+    """
+    return inspect.getmodule(func).__name__ + '.' + func.__name__
+
+
 def get_retry_delay(failure_index):
     """
     Get the delay before retrying the goal.
@@ -562,27 +825,40 @@ def get_retry_delay(failure_index):
     return datetime.timedelta(seconds=10) * (2 ** failure_index)
 
 
+OLD_GOALS_REMOVAL_BATCH_SIZE = 100
+OLD_GOALS_REMOVAL_MAX_BATCHES = 10
+
+
 def remove_old_goals(now):
+    """
+    Delete a batch of achieved goals older than retention period.
+    Returns the number of goals deleted.
+    """
     retention_seconds = getattr(settings, 'GOALS_RETENTION_SECONDS', 60 * 60 * 24 * 7)
     if retention_seconds is None:
-        return
+        return 0
     try:
         with transaction.atomic():
             ids_to_delete = Goal.objects.filter(
                 state=GoalState.ACHIEVED,
                 created_at__lt=now - datetime.timedelta(seconds=retention_seconds),
-            ).select_for_update(
+            ).order_by('created_at').select_for_update(  # oldest first, along goals_achieved_idx
                 skip_locked=True,
             ).values_list('id', flat=True)
-            ids_to_delete = list(ids_to_delete[:100])
+            ids_to_delete = list(ids_to_delete[:OLD_GOALS_REMOVAL_BATCH_SIZE])
             if not ids_to_delete:
-                return
-            GoalDependency.objects.filter(precondition_goal_id__in=ids_to_delete).delete()
-            GoalDependency.objects.filter(dependent_goal_id__in=ids_to_delete).delete()
+                return 0
+            # dependencies on both sides in one go, precondition side would be protected otherwise
+            GoalDependency.objects.filter(
+                models.Q(precondition_goal_id__in=ids_to_delete) |
+                models.Q(dependent_goal_id__in=ids_to_delete),
+            ).delete()
             Goal.objects.filter(id__in=ids_to_delete).delete()
             logger.info('Deleted %s old, achieved goals', len(ids_to_delete))
+            return len(ids_to_delete)
     except models.ProtectedError as e:
         logger.warning('When cleaning old goals: %s', e)
+        return 0
 
 
 class RetryMeLater:
@@ -613,6 +889,7 @@ def schedule(
     """
     Schedule a goal to be pursued.
     """
+    now = timezone.now()
     state = GoalState.WAITING_FOR_DATE
 
     instructions = {}
@@ -624,7 +901,7 @@ def schedule(
         instructions = None
 
     if precondition_date is None:
-        precondition_date = timezone.now()
+        precondition_date = now
         state = GoalState.WAITING_FOR_PRECONDITIONS
     if precondition_goals is None:
         precondition_goals = []
@@ -635,7 +912,7 @@ def schedule(
         state = GoalState.WAITING_FOR_WORKER
     if blocked:
         state = GoalState.BLOCKED
-    func_name = inspect.getmodule(func).__name__ + '.' + func.__name__
+    func_name = _handler_name(func)
 
     if deadline is None and thread_local.current_goal is not None:
         deadline = thread_local.current_goal.deadline
@@ -643,7 +920,7 @@ def schedule(
         default_deadline_delta = datetime.timedelta(
             seconds=getattr(settings, 'GOALS_DEFAULT_DEADLINE_SECONDS', 7 * 24 * 60 * 60),
         )
-        deadline = timezone.now() + default_deadline_delta
+        deadline = now + default_deadline_delta
 
     goal = Goal(
         state=state,
@@ -652,6 +929,7 @@ def schedule(
         precondition_date=precondition_date,
         deadline=deadline,
         preconditions_mode=preconditions_mode,
+        created_at=now,
     )
     if listen:
         listen_goal_progress(goal.id)
@@ -690,11 +968,16 @@ def _add_precondition_goals(goal, precondition_goals):
     new_precondition_goals = list(Goal.objects.filter(
         id__in=[g.id for g in precondition_goals],
     ).exclude(
-        dependent_goals=goal,
-    ).select_for_update(no_key=True))
+        id__in=GoalDependency.objects.filter(dependent_goal=goal).values('precondition_goal'),
+    ).only('id', 'state').select_for_update(no_key=True))
 
     # add to our preconditions
-    goal.precondition_goals.add(*new_precondition_goals)
+    # Existing dependencies are excluded above, so there is no need for the extra query
+    # `precondition_goals.add()` does to find them.
+    GoalDependency.objects.bulk_create([
+        GoalDependency(dependent_goal=goal, precondition_goal=precondition_goal)
+        for precondition_goal in new_precondition_goals
+    ])
 
     # update waiting-for counters
     for precondition_goal in new_precondition_goals:
@@ -714,12 +997,11 @@ def _add_precondition_goals(goal, precondition_goals):
         # We assume that precondition_goals contain the version checked by the handler.
         # This is releavnt only for ANY precond mode - because we are interested in act of
         # precond becoming achieved, not the final state like in ALL mode.
-        orig_preconds_by_id = {g.id: g for g in precondition_goals}
+        orig_states_by_id = {g.id: g.state for g in precondition_goals}
         for precondition_goal in new_precondition_goals:
-            orig_goal = orig_preconds_by_id[precondition_goal.id]
             if (
                 precondition_goal.state == GoalState.ACHIEVED and
-                orig_goal.state != GoalState.ACHIEVED
+                orig_states_by_id[precondition_goal.id] != GoalState.ACHIEVED
             ):
                 goal.waiting_for_count = 0
     goal.save(update_fields=[
@@ -735,13 +1017,39 @@ def _add_precondition_goals(goal, precondition_goals):
 
 
 def update_goals_deadline(goals_qs, deadline):
-    goals_to_be_updated = list(goals_qs.filter(
-        deadline__gt=deadline,
-    ).exclude(
-        state=GoalState.ACHIEVED,
-    ))
-    Goal.objects.filter(
-        id__in=[goal.id for goal in goals_to_be_updated],
-    ).update(deadline=Least('deadline', models.Value(deadline)))
-    for goal in goals_to_be_updated:
-        update_goals_deadline(goal.precondition_goals.all(), deadline)
+    """
+    Move deadline of the goals and their preconditions (transitively) earlier, if needed.
+    The precondition graph is walked with a recursive query, so this is a single round-trip
+    regardless of its depth. Walk stops at goals that are achieved or already have early enough deadline.
+    """
+    try:
+        seed_sql, seed_params = goals_qs.values('id').query.sql_with_params()
+    except EmptyResultSet:
+        return
+    goal_table = Goal._meta.db_table
+    dependency_table = GoalDependency._meta.db_table
+    # The deadline filters apply to the snapshot the CTE reads. A concurrent transaction may commit
+    # an even earlier deadline before we get the row lock, and UPDATE then sees that new version,
+    # so LEAST keeps us from moving such a deadline later.
+    with connections['default'].cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH RECURSIVE to_update(id) AS (
+                SELECT id FROM {goal_table}
+                WHERE id IN ({seed_sql}) AND deadline > %s AND state <> %s
+                UNION
+                SELECT goal.id FROM {dependency_table} dependency
+                JOIN to_update ON dependency.dependent_goal_id = to_update.id
+                JOIN {goal_table} goal ON goal.id = dependency.precondition_goal_id
+                WHERE goal.deadline > %s AND goal.state <> %s
+            )
+            UPDATE {goal_table} SET deadline = LEAST({goal_table}.deadline, %s)
+            FROM to_update
+            WHERE {goal_table}.id = to_update.id
+            """,
+            [
+                *seed_params, deadline, GoalState.ACHIEVED,
+                deadline, GoalState.ACHIEVED,
+                deadline,
+            ],
+        )
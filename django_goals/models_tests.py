@@ -4,8 +4,9 @@ import pytest
 
 from .factories import GoalFactory
 from .models import (
-    GoalState, PreconditionsMode, handle_unblocked_goals, schedule,
-    unblock_retry_goal,
+    Goal, GoalState, PreconditionsMode, _mark_as_failed,
+    handle_unblocked_goals, schedule, unblock_retry_goal, unblock_retry_goals,
+    update_goals_deadline,
 )
 
 
@@ -34,6 +35,48 @@ def test_retry_dependent_on(goal):
     assert next_goal.state == GoalState.WAITING_FOR_DATE
 
 
+@pytest.mark.django_db
+def test_retry_many():
+    failed_goals = [
+        GoalFactory(state=GoalState.GIVEN_UP),
+        GoalFactory(state=GoalState.BLOCKED),
+    ]
+    achieved_goal = GoalFactory(state=GoalState.ACHIEVED)
+    next_goal = GoalFactory(
+        state=GoalState.NOT_GOING_TO_HAPPEN_SOON,
+        precondition_goals=failed_goals,
+        waiting_for_count=2,
+        waiting_for_not_achieved_count=2,
+        waiting_for_failed_count=2,
+    )
+    unblocked_ids = unblock_retry_goals([goal.id for goal in failed_goals] + [achieved_goal.id])
+    assert set(unblocked_ids) == {goal.id for goal in failed_goals}
+    for goal in failed_goals:
+        goal.refresh_from_db()
+        assert goal.state == GoalState.WAITING_FOR_DATE
+    achieved_goal.refresh_from_db()
+    assert achieved_goal.state == GoalState.ACHIEVED
+    next_goal.refresh_from_db()
+    assert next_goal.waiting_for_failed_count == 0
+
+
+@pytest.mark.django_db
+def test_block_goals_depending_on_each_other():
+    first_goal = GoalFactory(state=GoalState.WAITING_FOR_PRECONDITIONS)
+    second_goal = GoalFactory(
+        state=GoalState.WAITING_FOR_PRECONDITIONS,
+        precondition_goals=[first_goal],
+        waiting_for_count=1,
+        waiting_for_not_achieved_count=1,
+    )
+    _mark_as_failed([first_goal.id, second_goal.id], target_state=GoalState.BLOCKED)
+    first_goal.refresh_from_db()
+    second_goal.refresh_from_db()
+    assert first_goal.state == GoalState.BLOCKED
+    assert second_goal.state == GoalState.BLOCKED
+    assert second_goal.waiting_for_failed_count == 1
+
+
 def noop(goal):  # pylint: disable=unused-argument
     pass
 
@@ -52,6 +95,27 @@ def test_schedule_updates_deadline():
     assert goal_a.deadline == now - datetime.timedelta(minutes=1)
 
 
+@pytest.mark.django_db
+def test_update_goals_deadline_transitively():
+    now = datetime.datetime(2024, 11, 6, 11, 41, 0, tzinfo=datetime.timezone.utc)
+    early_deadline = now - datetime.timedelta(minutes=1)
+    goal_a = GoalFactory(deadline=now)
+    goal_b = GoalFactory(deadline=now, state=GoalState.ACHIEVED)
+    goal_c = GoalFactory(deadline=now, precondition_goals=[goal_a])
+    goal_d = GoalFactory(deadline=now, precondition_goals=[goal_b])
+    goal_e = GoalFactory(deadline=now, precondition_goals=[goal_c, goal_d])
+    update_goals_deadline(Goal.objects.filter(id=goal_e.id), early_deadline)
+    for goal, expected_deadline in [
+        (goal_a, early_deadline),
+        (goal_b, now),  # achieved goals keep their deadline
+        (goal_c, early_deadline),
+        (goal_d, early_deadline),
+        (goal_e, early_deadline),
+    ]:
+        goal.refresh_from_db()
+        assert goal.deadline == expected_deadline
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize(
     ('goal', 'expected_waiting_for', 'expected_waiting_for_failed_count'),
@@ -5,7 +5,18 @@ def notify_goal_waiting_for_worker(cursor, goal_id):
     """
     Notify that the goal is waiting for a worker to pick it up.
     """
-    cursor.execute("NOTIFY goal_waiting_for_worker, %s", [str(goal_id)])
+    # pg_notify() instead of NOTIFY statement, because the latter can't take bound parameters
+    cursor.execute("SELECT pg_notify('goal_waiting_for_worker', %s)", [str(goal_id)])
+
+
+def notify_goals_waiting_for_worker(cursor, goal_ids):
+    """
+    Like `notify_goal_waiting_for_worker`, but sends notifications for many goals with a single query.
+    """
+    cursor.execute(
+        "SELECT pg_notify('goal_waiting_for_worker', goal_id) FROM unnest(%s::text[]) AS goal_id",
+        [[str(goal_id) for goal_id in goal_ids]],
+    )
 
 
 def listen_goal_waiting_for_worker():
@@ -13,13 +24,37 @@ def listen_goal_waiting_for_worker():
         cursor.execute("LISTEN goal_waiting_for_worker")
 
 
+def wait_goal_waiting_for_worker(timeout):
+    """
+    Block until a goal waiting for worker is announced, but not longer than `timeout` seconds.
+    Requires `listen_goal_waiting_for_worker` to be called first.
+    Other notifications delivered in the meantime are dropped - we are interested only in
+    the fact there is some work to do.
+    """
+    pg_conn = connection.connection
+    for _ in pg_conn.notifies(timeout=timeout, stop_after=1):
+        pass
+    drain_goal_waiting_for_worker()
+
+
+def drain_goal_waiting_for_worker():
+    """
+    Drop notifications received so far, without blocking.
+    psycopg queues notifications arriving during other queries, so a listening worker
+    has to drain them even when it never gets idle, or the queue would grow without bound.
+    """
+    for _ in connection.connection.notifies(timeout=0):
+        pass
+
+
 def notify_goal_progress(goal_id, state):
     """
     Notify that the goal has changed its state.
     """
     with connections['default'].cursor() as cursor:
         channel = get_goal_progress_channel(goal_id)
-        cursor.execute(f"NOTIFY {channel}, %s", [
+        cursor.execute("SELECT pg_notify(%s, %s)", [
+            channel,
             state,
         ])
 
@@ -1,7 +1,14 @@
+import time
+import uuid
+
 import pytest
+from django.db import connection
 
 from .blocking_worker import listen_goal_waiting_for_worker
 from .models import schedule
+from .notifications import (
+    notify_goals_waiting_for_worker, wait_goal_waiting_for_worker,
+)
 
 
 def noop():
@@ -19,3 +26,28 @@ def test_schedule_notifies(get_notifications):
     notification = notifications[0]
     assert notification.channel == 'goal_waiting_for_worker'
     assert notification.payload == str(goal.id)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('scheduled', [True, False])
+def test_wait_goal_waiting_for_worker(scheduled):
+    listen_goal_waiting_for_worker()
+    if scheduled:
+        schedule(noop)
+
+    start_time = time.monotonic()
+    wait_goal_waiting_for_worker(timeout=0.5)
+    time_taken = time.monotonic() - start_time
+
+    assert (time_taken < 0.5) is scheduled
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notify_goals_waiting_for_worker(get_notifications):
+    listen_goal_waiting_for_worker()
+    goal_ids = [uuid.uuid4() for _ in range(3)]
+    with connection.cursor() as cursor:
+        notify_goals_waiting_for_worker(cursor, goal_ids)
+    assert [
+        notification.payload for notification in get_notifications()
+    ] == [str(goal_id) for goal_id in goal_ids]
@@ -1,9 +1,12 @@
 import datetime
+import threading
 import time
+import uuid
 from unittest import mock
 
 import pytest
-from django.db import models
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from example_app.models import GoalRelatedModel
@@ -11,9 +14,10 @@ from example_app.models import GoalRelatedModel
 from .blocking_worker import listen_goal_waiting_for_worker
 from .factories import GoalFactory, GoalProgressFactory
 from .models import (
-    AllDone, Goal, GoalState, PreconditionsMode, RetryMeLater,
-    RetryMeLaterException, handle_waiting_for_preconditions,
-    handle_waiting_for_worker, schedule, thread_local, worker_turn,
+    OLD_GOALS_REMOVAL_BATCH_SIZE, AllDone, Goal, GoalProgress, GoalState,
+    PreconditionsMode, RetryMeLater, RetryMeLaterException, block_goal,
+    handle_waiting_for_preconditions, handle_waiting_for_worker, schedule,
+    thread_local, worker, worker_turn,
 )
 
 
@@ -24,6 +28,52 @@ def test_worker_turn_noop():
     assert transitions_done == (0, 0)
 
 
+@pytest.mark.django_db
+def test_worker_turn_idle_queries():
+    now = timezone.now()
+    GoalFactory(state=GoalState.ACHIEVED)
+    with mock.patch.object(
+        thread_local, 'old_goals_removed_at', now,
+    ), CaptureQueriesContext(connection) as queries:
+        assert worker_turn(now) == (0, 0)
+    goal_queries = [
+        query['sql'] for query in queries.captured_queries
+        if 'django_goals_goal' in query['sql']
+    ]
+    # checking all state transitions at once, then looking for goals waiting for worker
+    assert len(goal_queries) == 2
+
+
+@pytest.mark.django_db
+def test_worker_idle_wait_backoff():
+    stop_event = threading.Event()
+    timeouts = []
+
+    def wait(timeout):
+        timeouts.append(timeout)
+        if len(timeouts) == 8:
+            stop_event.set()
+
+    with mock.patch('django_goals.models.wait_goal_waiting_for_worker', wait):
+        worker(stop_event=stop_event)
+    assert timeouts == [0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1]
+
+
+def schedule_next(goal, remaining):  # pylint: disable=unused-argument
+    if remaining > 0:
+        schedule(schedule_next, args=[remaining - 1])
+    return AllDone()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_busy_worker_drains_notifications():
+    # every goal is announced to the worker, while it's busy pursuing the previous one
+    schedule(schedule_next, args=[10])
+    worker(max_progress_count=5)
+    assert Goal.objects.filter(state=GoalState.ACHIEVED).count() == 5
+    assert not connection.connection._notifies_backlog  # pylint: disable=protected-access
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize('goal', [
     {'state': GoalState.WAITING_FOR_DATE},
@@ -409,6 +459,7 @@ def take_too_long(goal):  # pylint: disable=unused-argument
     [
         (None, True),
         (1, False),
+        (0.5, False),
         (3, True),
     ],
 )
@@ -442,7 +493,7 @@ def test_old_achieved_goal_is_deleted(days_ago, state, expect_deleted):
     GoalProgressFactory(goal=goal)
     dependent_goal = GoalFactory(precondition_goals=[goal])
 
-    worker_turn(now)
+    worker_turn(now, force_remove_old_goals=True)
 
     exists_after = Goal.objects.filter(id=goal.id).exists()
     assert exists_after is not expect_deleted
@@ -467,7 +518,7 @@ def test_protected_old_achieved_goal():
 
     # worker turn doesn't crash, but emits a warning
     with mock.patch('django_goals.models.logger.warning') as warning:
-        worker_turn(now)
+        worker_turn(now, force_remove_old_goals=True)
     assert warning.call_count == 1
     assert 'old goals' in warning.call_args[0][0]
     assert 'protected' in str(warning.call_args[0][1])
@@ -485,3 +536,140 @@ def test_deadline_is_inherited():
     worker_turn(now)
     another_goal = Goal.objects.exclude(id=goal.id).get()
     assert another_goal.deadline == goal.deadline
+
+
+def achieve(goal):  # pylint: disable=unused-argument
+    return AllDone()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('batch_size', [1, 3, 10])
+def test_worker_turn_batch(settings, batch_size):
+    settings.GOALS_WORKER_BATCH_SIZE = batch_size
+    for _ in range(5):
+        schedule(achieve)
+    transitions_done, progress_count = worker_turn(timezone.now(), max_progress_count=4)
+    assert (transitions_done, progress_count) == (4, 4)
+    assert Goal.objects.filter(state=GoalState.ACHIEVED).count() == 4
+    assert Goal.objects.filter(state=GoalState.WAITING_FOR_WORKER).count() == 1
+    assert GoalProgress.objects.filter(success=True).count() == 4
+
+
+def block_other(goal, other_goal_id):  # pylint: disable=unused-argument
+    block_goal(uuid.UUID(other_goal_id))
+    return AllDone()
+
+
+@pytest.mark.django_db
+def test_worker_turn_batch_skips_goal_changed_by_earlier_goal(settings):
+    settings.GOALS_WORKER_BATCH_SIZE = 2
+    now = timezone.now()
+    other_goal = schedule(achieve, deadline=now + datetime.timedelta(hours=1))
+    schedule(block_other, args=[str(other_goal.id)], deadline=now)
+    transitions_done, progress_count = worker_turn(now)
+    assert progress_count == 1
+    other_goal.refresh_from_db()
+    assert other_goal.state == GoalState.BLOCKED
+    assert other_goal.progress_count == 0
+    assert not other_goal.progress.exists()
+
+
+def retry_with_precondition(goal, precondition_goal_id):  # pylint: disable=unused-argument
+    return RetryMeLater(precondition_goals=[Goal.objects.get(id=precondition_goal_id)])
+
+
+@pytest.mark.django_db
+def test_worker_turn_batch_sees_counters_changed_by_earlier_goal(settings):
+    settings.GOALS_WORKER_BATCH_SIZE = 2
+    now = timezone.now()
+    precondition_goal = GoalFactory(
+        state=GoalState.WAITING_FOR_WORKER,
+        handler='django_goals.worker_tests.achieve',
+        deadline=now,
+    )
+    new_precondition_goal = GoalFactory(
+        state=GoalState.WAITING_FOR_DATE,
+        precondition_date=now + datetime.timedelta(days=1),
+    )
+    goal = GoalFactory(
+        state=GoalState.WAITING_FOR_WORKER,
+        handler='django_goals.worker_tests.retry_with_precondition',
+        instructions={'args': [str(new_precondition_goal.id)]},
+        preconditions_mode=PreconditionsMode.ANY,
+        waiting_for_not_achieved_count=1,
+        deadline=now + datetime.timedelta(hours=1),
+        precondition_goals=[precondition_goal],
+    )
+    assert worker_turn(now)[1] == 2
+    goal.refresh_from_db()
+    assert goal.state == GoalState.WAITING_FOR_DATE
+    assert goal.waiting_for_count == 1
+    assert goal.waiting_for_not_achieved_count == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('goal', [{'state': GoalState.WAITING_FOR_PRECONDITIONS}], indirect=True)
+def test_worker_turn_stopped(goal):
+    stop_event = threading.Event()
+    stop_event.set()
+    assert worker_turn(timezone.now(), stop_event=stop_event) == (0, 0)
+    goal.refresh_from_db()
+    assert goal.state == GoalState.WAITING_FOR_PRECONDITIONS
+
+
+@pytest.mark.django_db
+def test_old_goals_removal_interval(settings):
+    settings.GOALS_CLEANUP_INTERVAL_SECONDS = 60
+    now = timezone.now()
+    worker_turn(now, force_remove_old_goals=True)
+    goal = GoalFactory(
+        state=GoalState.ACHIEVED,
+        created_at=now - timezone.timedelta(days=31),
+    )
+
+    worker_turn(now + timezone.timedelta(seconds=30))
+    assert Goal.objects.filter(id=goal.id).exists()
+
+    worker_turn(now + timezone.timedelta(seconds=60))
+    assert not Goal.objects.filter(id=goal.id).exists()
+
+
+@pytest.mark.django_db
+def test_old_goals_removal_in_batches():
+    now = timezone.now()
+    GoalFactory.create_batch(
+        OLD_GOALS_REMOVAL_BATCH_SIZE + 1,
+        state=GoalState.ACHIEVED,
+        created_at=now - timezone.timedelta(days=31),
+    )
+    worker_turn(now, force_remove_old_goals=True)
+    assert not Goal.objects.exists()
+
+
+@pytest.mark.django_db
+def test_old_goals_removal_batches_limit():
+    now = timezone.now()
+    GoalFactory.create_batch(
+        OLD_GOALS_REMOVAL_BATCH_SIZE + 1,
+        state=GoalState.ACHIEVED,
+        created_at=now - timezone.timedelta(days=31),
+    )
+    with mock.patch('django_goals.models.OLD_GOALS_REMOVAL_MAX_BATCHES', 1):
+        worker_turn(now)
+        assert Goal.objects.count() == 1
+        # removal is not finished, so it continues in the next turn
+        worker_turn(now)
+        assert not Goal.objects.exists()
+
+
+@pytest.mark.django_db
+def test_old_goals_removal_stopped():
+    now = timezone.now()
+    GoalFactory(
+        state=GoalState.ACHIEVED,
+        created_at=now - timezone.timedelta(days=31),
+    )
+    stop_event = threading.Event()
+    stop_event.set()
+    worker_turn(now, stop_event=stop_event, force_remove_old_goals=True)
+    assert Goal.objects.exists()